@@ -400,7 +400,27 @@
 import json
 import re
 import html
-from typing import Any, Dict, List, Iterable, Tuple
+from typing import Any, Dict, List, Iterable, Iterator, Tuple
+
+import ijson
+
+def iter_har_entries(har_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a HAR file's entries one at a time with ijson, so only the entry
+    being looked at is held in memory rather than the whole (often 50-200 MB)
+    export. Callers that stop at the first match never parse the rest.
+    Handles the standard {"log": {"entries": [...]}} layout and a bare
+    top-level "entries" list.
+    """
+    found = False
+    with open(har_path, 'rb') as f:
+        for entry in ijson.items(f, 'log.entries.item', use_float=True):
+            found = True
+            yield entry
+    if found:
+        return
+    with open(har_path, 'rb') as f:
+        yield from ijson.items(f, 'entries.item', use_float=True)
 
 def parse_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -539,6 +559,7 @@ def extract_search_queries(parsed_events: List[Dict[str, Any]]) -> List[str]:
     De-duplicates while preserving order.
     """
     queries: List[str] = []
+    qapp = queries.append
     search_call_re = re.compile(r'search\(\s*["\'](.*?)["\']\s*\)', re.DOTALL)
 
     for ev in parsed_events:
@@ -557,7 +578,7 @@ def extract_search_queries(parsed_events: List[Dict[str, Any]]) -> List[str]:
             for s in _iter_strings(payload):
                 for m in search_call_re.findall(s):
                     if m:
-                        queries.append(html.unescape(m.strip()))
+                        qapp(html.unescape(m.strip()))
 
     # Deduplicate while preserving order
     seen = set()
@@ -630,18 +651,19 @@ def extract_urls(parsed_events: List[Dict[str, Any]]) -> Tuple[List[str], List[s
                 url = um.get("full_url")
                 if url:
                     given.append(url)
-        
-        # dedupe preserving order
-        all_urls = accessed + given
-        normal_urls: List[str] = []
-        cited_urls: List[str] = []
-        for u in all_urls:
-            if u in normal_urls or u in cited_urls:
-                continue
-            if 'utm_source=chatgpt.com' in u:
-                cited_urls.append(u)
-            else:
-                normal_urls.append(u)
+
+    # dedupe preserving order (once, after all events are collected)
+    normal_urls: List[str] = []
+    cited_urls: List[str] = []
+    seen = set()
+    for u in accessed + given:
+        if u in seen:
+            continue
+        seen.add(u)
+        if 'utm_source=chatgpt.com' in u:
+            cited_urls.append(u)
+        else:
+            normal_urls.append(u)
 
     return accessed, given, normal_urls, cited_urls
 
@@ -649,10 +671,9 @@ def process_har_files(har_list: List[str], target_url: str) -> List[Dict[str, An
     results: List[Dict[str, Any]] = []
     for har_path in har_list:
         try:
-            with open(har_path, 'r', encoding='utf-8') as f:
-                har = json.load(f)
-            entries = har.get('entries') or har.get('log', {}).get('entries', [])
+            entries = iter_har_entries(har_path)
             matched = next((e for e in entries if e.get('request', {}).get('url') == target_url), None)
+            entries.close()
             if not matched:
                 raise ValueError(f"No entry with URL '{target_url}' in {har_path}")
 
@@ -694,16 +715,12 @@ CLAUDE_COMPLETION_RE = re.compile(
 
 def find_and_parse_claude_completion(har_path: str) -> Dict[str, Any]:
     """
-    Load a HAR file and find the first Claude completion entry
+    Stream a HAR file and find the first Claude completion entry
     (org ID + chat ID don't need to be known).
     Returns metrics dict including 'entry_index' and 'matched_url'.
     Raises ValueError if not found.
     """
-    with open(har_path, 'r', encoding='utf-8') as f:
-        har = json.load(f)
-
-    entries = har.get('entries') or har.get('log', {}).get('entries', [])
-    for idx, entry in enumerate(entries):
+    for idx, entry in enumerate(iter_har_entries(har_path)):
         req = entry.get('request', {})
         url = req.get('url') or ""
         try:
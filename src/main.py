@@ -3,13 +3,18 @@ import os
 import json
 from datetime import datetime
 
-from serp_scrapers.bing_scraper import scrape_bing_to_csv
+from tqdm import tqdm
+
+from serp_scrapers.bing_scraper import scrape_bing_batch_to_csv
 from serp_scrapers.google_scraper import scrape_google_to_csv  # if available
 from serp_scrapers.brave_scraper import scrape_brave_to_csv
 from serp_scrapers.duckduckgo_scraper import scrape_duckduckgo_to_csv
 from evaluators.evaluation import check_urls  # URL evaluation helper
 from chatgpt_scraper.har_parser import har_parser  # For parsing .har files
 
+# Characters in a query that can't appear in a CSV filename
+_SAFE_TRANS = str.maketrans({' ': '_', '\\': '_', '/': '_'})
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Unified SERP scraper & evaluator using .har inputs"
@@ -36,8 +41,8 @@ def parse_args():
         help='Directory to save query folders and results'
     )
     parser.add_argument(
-        '-l', '--logs-print', default=False,
-        help='Directory to save query folders and results'
+        '-l', '--logs-print', action='store_true',
+        help='Print progress logs while scraping'
     )
     parser.add_argument(
         '--gpt5', default=False,
@@ -49,9 +54,8 @@ def parse_args():
 def main():
     args = parse_args()
 
-    def printLog(toPrint):
-        if args.logs_print:
-            print(toPrint)
+    # Bind once so the hot loops don't re-check the flag on every call
+    printLog = print if args.logs_print else (lambda *_a, **_k: None)
 
     # Ensure output directory
     os.makedirs(args.output_dir, exist_ok=True)
@@ -62,77 +66,91 @@ def main():
     printLog("All .har files parsed")
     # return
 
-    import glob
-    from tqdm import tqdm
-
-
-    # Iterate over each HAR entry
-    for entry in tqdm(parsed_entries, desc="HAR entries"):
-        harname = os.path.splitext(os.path.basename(entry['harname']))[0]
-
-        # Check for an existing folder matching pattern: harname_*
-        pattern = os.path.join(args.output_dir, f"{harname}_*")
-        existing_folders = glob.glob(pattern)
-
-        if existing_folders:
-            # If a folder exists, just use the first one found (or you can choose by sorting)
-            folder = existing_folders[0]
-        else:
+    # Index existing "<harname>_<YYYYmmdd>_<HHMMSS>" folders with a single directory scan
+    existing_folders = {}
+    with os.scandir(args.output_dir) as it:
+        for e in it:
+            if e.is_dir():
+                existing_folders.setdefault(e.name.rsplit('_', 2)[0], e.path)
+
+    # Strip dir/extension once per distinct HAR path
+    harnames = {
+        e['harname']: os.path.splitext(os.path.basename(e['harname']))[0]
+        for e in parsed_entries
+    }
+
+    # Resolve each entry's output folder and flatten its queries x engines into one job list
+    entry_folders = []
+    jobs = []
+    for entry in parsed_entries:
+        harname = harnames[entry['harname']]
+
+        # If a folder already exists for this harname, just reuse it
+        folder = existing_folders.get(harname)
+        if folder is None:
             # Otherwise, create a new one with timestamp
             folder = os.path.join(args.output_dir, f"{harname}_{timestamp}")
             os.makedirs(folder, exist_ok=True)
+            existing_folders[harname] = folder
+        entry_folders.append((entry, harname, folder))
 
-        printLog("Running SERP on "+harname)
-
-        # Scrape each search string
-        search_strings = entry.get('search_strings', [])
-        for idx, query in enumerate(tqdm(search_strings, desc=f"Queries ({harname})"), start=1):
-            safe_q = query.replace(' ', '_')[:12]
-            safe_q = safe_q.replace('\\', '_')[:12]
-            safe_q = safe_q.replace('/', '_')[:12]
-            for engine in tqdm(args.search_engines, desc="Search engines", leave=False):
+        for idx, query in enumerate(entry.get('search_strings', []), start=1):
+            safe_q = query.translate(_SAFE_TRANS)[:12]
+            for engine in args.search_engines:
                 csv_path = os.path.join(folder, f"{harname}_{idx}_{engine}_{safe_q}.csv")
-                if engine == 'bing':
-                    printLog("Running bing for "+harname)
-                    scrape_bing_to_csv(
-                        query=query,
-                        output_file=csv_path,
-                        max_results=args.max_se_index,
-                        batch_size=args.index_interval
-                    )
-                elif engine == 'google':
-                    printLog("Running Google for "+harname)
-                    scrape_google_to_csv(
-                        query=query,
-                        output_file=csv_path,
-                        max_results=args.max_se_index,
-                        page_size=args.index_interval
-                    )
-                elif engine == 'brave':
-                    printLog("Running Brave for "+harname)
-                    scrape_brave_to_csv(
-                        query=query,
-                        output_file=csv_path,
-                        max_results=args.max_se_index,
-                        page_size=args.index_interval
-                    )
-                elif engine == 'ddg':
-                    printLog("Running DuckDuckGo for "+harname)
-                    scrape_duckduckgo_to_csv(
-                        query=query,
-                        output_file=csv_path,
-                        max_results=args.max_se_index,
-                        page_size=args.index_interval
-                    )
-                else:
-                    print(f"Engine '{engine}' not supported. Skipping.")
+                jobs.append((harname, engine, query, csv_path))
+
+    printLog(f"Queued {len(jobs)} SERP jobs across {len(entry_folders)} HAR entries")
+
+    # Bing queries go to Oxylabs as one Push-Pull batch submit per SERP page
+    bing_jobs = [(query, csv_path) for _, engine, query, csv_path in jobs if engine == 'bing']
+    if bing_jobs:
+        printLog(f"Running bing for {len(bing_jobs)} queries")
+        scrape_bing_batch_to_csv(
+            bing_jobs,
+            max_results=args.max_se_index,
+            batch_size=args.index_interval
+        )
+
+    # Scrape each remaining (query, engine) pair
+    other_jobs = [job for job in jobs if job[1] != 'bing']
+    for harname, engine, query, csv_path in tqdm(other_jobs, desc="SERP"):
+        if engine == 'google':
+            printLog("Running Google for "+harname)
+            scrape_google_to_csv(
+                query=query,
+                output_file=csv_path,
+                max_results=args.max_se_index,
+                page_size=args.index_interval
+            )
+        elif engine == 'brave':
+            printLog("Running Brave for "+harname)
+            scrape_brave_to_csv(
+                query=query,
+                output_file=csv_path,
+                max_results=args.max_se_index,
+                page_size=args.index_interval
+            )
+        elif engine == 'ddg':
+            printLog("Running DuckDuckGo for "+harname)
+            scrape_duckduckgo_to_csv(
+                query=query,
+                output_file=csv_path,
+                max_results=args.max_se_index,
+                page_size=args.index_interval
+            )
+        else:
+            print(f"Engine '{engine}' not supported. Skipping.")
 
+    # Evaluate each HAR entry against its scraped CSVs
+    for entry, harname, folder in tqdm(entry_folders, desc="HAR entries"):
         # Prepare URL list file (merge and dedupe)
-        urls = set(entry.get('url', []))
+        # dict.fromkeys dedupes in one pass and keeps HAR order stable across runs
+        urls = list(dict.fromkeys(entry.get('url', [])))
         urls_txt = os.path.join(folder, f"urls_to_eval_{timestamp}.txt")
-        with open(urls_txt, 'w', encoding='utf-8') as f:
-            for u in sorted(urls):
-                f.write(u + '\n')
+        with open(urls_txt, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            if urls:
+                f.write('\n'.join(urls) + '\n')
 
         # Gather all CSVs
         csv_files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith('.csv')]
@@ -1,22 +1,26 @@
 import os
+import re
+import math
 import time
 import random
-import csv
+import itertools
 import sys
 import urllib.parse
 import http.client
-from urllib.parse import urlparse
 from bs4 import BeautifulSoup
 
+from .csv_writer import CsvWriterThread
+from .url_utils import is_excluded, split_url, url_netloc, drop_tracking_params, unseen_rows
+
 # ————— Configuration ————— #
 delay_range = (1, 2)           # min/max delay between requests in seconds
 
 # A set of domains you know you want to skip
-EXCLUDED_DOMAINS = {
+EXCLUDED_DOMAINS = frozenset({
     "www.zhihu.com",
     "zhihu.com",
     # add more if needed
-}
+})
 
 # Oxylabs credentials (set these in your environment)
 OXY_USERNAME = os.getenv("OXY_USERNAME")
@@ -27,7 +31,7 @@ WSA_API_KEY = os.getenv("WSA_API_KEY")
 WSA_HOST    = "api.webscrapingapi.com"
 
 
-EAST_COAST_ZIPCODES = [
+EAST_COAST_ZIPCODES = (
     # Maine
     "04032",  # Westbrook, ME
     "04101",  # Portland, ME
@@ -107,26 +111,19 @@ EAST_COAST_ZIPCODES = [
     "32301",  # Tallahassee, FL
     "32202",  # Jacksonville, FL
     "32114",  # Daytona Beach, FL
-]
+)
+
+# Walk the ZIPs in one shuffled order, so every ZIP is used once per len(EAST_COAST_ZIPCODES) calls
+_ZIP_ITER = itertools.cycle(random.sample(EAST_COAST_ZIPCODES, len(EAST_COAST_ZIPCODES)))
 
 #### HELPER
 
 import base64
-from urllib.parse import urlparse, parse_qs, unquote, urlunparse, urlencode
-
-TRACKING_KEYS = {
-    "utm_source","utm_medium","utm_campaign","utm_term","utm_content",
-    "gclid","gbraid","wbraid","fbclid","msclkid","ocid","cvid","form","spm","ved","ei","oq","sxsrf","sca_esv","ntb"
-}
+from functools import lru_cache
+from urllib.parse import parse_qs, unquote
 
-def _drop_tracking_params(url: str) -> str:
-    try:
-        p = urlparse(url)
-        q = parse_qs(p.query, keep_blank_values=True)
-        q = {k: v for k, v in q.items() if k not in TRACKING_KEYS and not k.startswith("utm_")}
-        return urlunparse((p.scheme, p.netloc, p.path, p.params, urlencode(q, doseq=True), p.fragment))
-    except Exception:
-        return url
+# A percent-encoded http(s) URL embedded in a redirector's query string
+_PCT_HTTP_RE = re.compile(r"https?%3A%2F%2F[^&]+")
 
 def _maybe_b64_decode(s: str) -> str:
     # Some Bing values are like a1<base64-no-padding>
@@ -139,7 +136,8 @@ def _maybe_b64_decode(s: str) -> str:
     except Exception:
         return s
 
-def resolve_bing_redirect(href: str) -> str:
+@lru_cache(maxsize=16384)
+def resolve_bing_redirect(href: str) -> tuple[str, str]:
     """
     Turn Bing/MSN redirect URLs into the final destination.
     Handles:
@@ -147,17 +145,18 @@ def resolve_bing_redirect(href: str) -> str:
       - https://r.msn.com/... ?ru=<target>
       - https://go.msn.com/... ?target=<target> / ?ru=<target>
     Also strips common tracking params.
+    Returns (clean_url, lowercased netloc) so callers don't re-parse for the domain check.
     """
     try:
         # print(href)
-        p = urlparse(href)
-        host = p.netloc.lower()
+        _, netloc, _, query, _ = split_url(href)
+        host = netloc.lower()
 
         # If it’s already not a Bing/MSN redirector, just clean and return
         if "bing.com" not in host and "msn.com" not in host:
-            return _drop_tracking_params(href)
+            return drop_tracking_params(href), host
 
-        q = parse_qs(p.query, keep_blank_values=True)
+        q = parse_qs(query, keep_blank_values=True)
         candidate = q.get("u", [None])[0] or q.get("ru", [None])[0] or q.get("target", [None])[0] or q.get("url", [None])[0]
         # print(candidate)
 
@@ -169,104 +168,180 @@ def resolve_bing_redirect(href: str) -> str:
                 # print("b64")
             if cand_dec.startswith(("http://", "https://")):
                 # print(cand_dec)
-                return _drop_tracking_params(cand_dec)
+                return drop_tracking_params(cand_dec), url_netloc(cand_dec)
 
         # Fallback: sometimes the only http(s) appears percent-encoded in the query
-        from re import search
-        m = search(r"(https?%3A%2F%2F[^&]+)", p.query)
+        m = _PCT_HTTP_RE.search(query)
         if m:
-            return _drop_tracking_params(unquote(m.group(1)))
+            target = unquote(m.group(0))
+            return drop_tracking_params(target), url_netloc(target)
 
-        return _drop_tracking_params(href)
+        return drop_tracking_params(href), host
     except Exception:
-        return href
+        return href, ""
 
 
 
 ####
-# ===================== OXYLABS (requests-based) =====================
-import requests
+# ===================== OXYLABS (aiohttp + Push-Pull API, one job per query page) =====================
+import asyncio
+import aiohttp
+import ijson
+import orjson
+
+# Bing SERP pages fetched per query (Oxylabs returns ~10 organic results per page)
+BING_PAGES = 10
+
+# Max in-flight Oxylabs jobs. Push-Pull jobs don't hold a socket open while
+# Oxylabs scrapes, so this can be much higher than with the Realtime API.
+OXY_CONCURRENCY = 32
+
+# Push-Pull API: submit a job, poll its status, then pull the results
+OXY_JOBS_URL = "https://data.oxylabs.io/v1/queries"
+# Batch submit: one POST creates a job for every query in the list
+OXY_BATCH_URL = "https://data.oxylabs.io/v1/queries/batch"
+OXY_BATCH_MAX = 1000     # queries per batch submit (Oxylabs allows up to 5000)
+OXY_POLL_INITIAL = 0.5   # first poll delay (s); doubles each poll
+OXY_POLL_MAX = 8.0       # cap on the poll delay (s)
+OXY_JOB_TIMEOUT = 220    # give up on a job after this many seconds
+
+# Job payload with only query/start_page varying, serialized once up front.
+# IMPORTANT: single-object payload (not a list). 'query' must be a string.
+# Oxylabs pages are 1-based; start_page=1 is the same as omitting it.
+_PAYLOAD_TMPL = b'{"source":"bing_search","query":%b,"start_page":%d,"pages":1,"parse":true}'
+# "geo_location" is left out for now (see _ZIP_ITER)
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# ijson path to each organic result inside a Push-Pull results response
+_ORGANIC_PREFIX = "results.item.content.results.organic.item"
+
+def _oxy_session_request(session, method, url, **kwargs):
+    return session.request(
+        method,
+        url,
+        auth=aiohttp.BasicAuth(OXY_USERNAME, OXY_PASSWORD),
+        timeout=aiohttp.ClientTimeout(total=60),
+        **kwargs
+    )
+
+async def _raise_for_oxy_status(r):
+    if r.status == 403:
+        print("ERROR: Oxylabs free-trial credits exhausted (HTTP 403).")
+        sys.exit(1)
+
+    if not 200 <= r.status < 300:
+        raise RuntimeError(f"Oxylabs HTTP {r.status}: {(await r.text())[:300]}")
 
-# ===================== OXYLABS (requests-based, fixed payload) =====================
-import requests
+async def _oxy_request(session, method, url, **kwargs):
+    """Make one authenticated Oxylabs call and return the decoded JSON body."""
+    try:
+        async with _oxy_session_request(session, method, url, **kwargs) as r:
+            await _raise_for_oxy_status(r)
+            return await r.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise RuntimeError(f"Network error talking to Oxylabs: {e}") from e
 
-def fetch_bing_results(query, start, batch_size):
+async def _iter_oxy_organic(session, job_id):
     """
-    Fetch one page of Bing results via Oxylabs Realtime API (no SDK).
-    Returns up to batch_size (title, link) tuples, skipping excluded domains.
+    Stream a finished job's results and yield each organic item as soon as
+    ijson has decoded it, without buffering the whole (multi-MB) body.
     """
-    if not OXY_USERNAME or not OXY_PASSWORD:
-        raise RuntimeError("Missing OXY_USERNAME / OXY_PASSWORD environment variables.")
-
-    # Pick a random East-Coast ZIP code each call
-    geo = random.choice(EAST_COAST_ZIPCODES)
-
-    # Oxylabs pages are 1-based
-    page_num = (start) // batch_size + 1
-
-    url = "https://realtime.oxylabs.io/v1/queries"
-
-    # IMPORTANT: single-object payload (not a list). 'query' must be a string.
-    payload = {
-        "source": "bing_search",
-        "query": query,
-        # "start_page": page_num,
-        **({"start_page": page_num} if page_num > 1 else {}),
-        "pages": 10,
-        # "limit": batch_size,
-        "parse": True,
-        # "geo_location": geo
-    }
-
     try:
-        r = requests.post(
-            url,
-            auth=(OXY_USERNAME, OXY_PASSWORD),
-            json=payload,
-            timeout=220
-        )
-    except requests.RequestException as e:
+        async with _oxy_session_request(session, "GET", f"{OXY_JOBS_URL}/{job_id}/results") as r:
+            await _raise_for_oxy_status(r)
+            async for item in ijson.items(r.content, _ORGANIC_PREFIX):
+                yield item
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         raise RuntimeError(f"Network error talking to Oxylabs: {e}") from e
 
-    if r.status_code == 403:
-        print("ERROR: Oxylabs free-trial credits exhausted (HTTP 403).")
-        sys.exit(1)
+async def _wait_for_oxy_job(session, job_id):
+    """Poll a Push-Pull job with exponential backoff until it is done."""
+    deadline = time.monotonic() + OXY_JOB_TIMEOUT
+    delay = OXY_POLL_INITIAL
+    while True:
+        job = await _oxy_request(session, "GET", f"{OXY_JOBS_URL}/{job_id}")
+        status = job.get("status")
+        if status == "done":
+            return
+        if status == "faulted":
+            raise RuntimeError(f"Oxylabs job {job_id} faulted.")
+        if time.monotonic() + delay > deadline:
+            raise RuntimeError(f"Oxylabs job {job_id} still '{status}' after {OXY_JOB_TIMEOUT}s.")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, OXY_POLL_MAX)
+
+async def submit_bing_batch(session, queries, page_num):
+    """
+    Submit page page_num of every query in one Push-Pull batch call.
+    Returns the job ids in the same order as queries.
+    """
+    if not OXY_USERNAME or not OXY_PASSWORD:
+        raise RuntimeError("Missing OXY_USERNAME / OXY_PASSWORD environment variables.")
 
-    if r.status_code != 200:
-        raise RuntimeError(f"Oxylabs HTTP {r.status_code}: {r.text[:300]}")
+    job_ids = []
+    for i in range(0, len(queries), OXY_BATCH_MAX):
+        chunk = queries[i:i + OXY_BATCH_MAX]
+        # Batch payloads take a list of queries; every other field applies to all of them
+        body = orjson.dumps({
+            "source": "bing_search",
+            "query": chunk,
+            "start_page": page_num,
+            "pages": 1,
+            "parse": True,
+        })
+        resp = await _oxy_request(session, "POST", OXY_BATCH_URL, data=body, headers=_JSON_HEADERS)
+        jobs = resp.get("queries") or []
+        if len(jobs) != len(chunk) or not all(job.get("id") for job in jobs):
+            raise RuntimeError(f"Oxylabs batch returned {len(jobs)} jobs for {len(chunk)} queries: {str(resp)[:300]}")
+        # Jobs come back in submission order
+        job_ids.extend(job["id"] for job in jobs)
+    return job_ids
+
+async def fetch_bing_job(session, job_id):
+    """
+    Wait for one Push-Pull job and pull its page of Bing results.
+    Returns parallel (titles, links) lists for that page, skipping excluded domains.
+    """
+    await _wait_for_oxy_job(session, job_id)
 
-    data = r.json()
+    titles = []
+    links = []
+    async for item in _iter_oxy_organic(session, job_id):
+        title = item.get("title")
+        raw_link = item.get("link") or item.get("url")
+        if not title or not raw_link:
+            continue
 
-    results = []
+        link, domain = resolve_bing_redirect(raw_link)
+        if is_excluded(domain, EXCLUDED_DOMAINS):
+            print(f"Domain Excluded: {domain}")
+            continue
 
-    # Oxylabs usually returns a list under 'results'
-    pages = data.get("results", [])
-    # (Some responses may return a single object; normalize)
-    if isinstance(pages, dict):
-        pages = [pages]
+        titles.append(title)
+        links.append(link)
 
-    for page in pages:
-        organic = (
-            page.get("content", {})
-                .get("results", {})
-                .get("organic", [])
-        )
-        for item in organic:
-            title = item.get("title")
-            raw_link = item.get("link") or item.get("url")
-            if not title or not raw_link:
-                continue
+    return titles, links
 
-            link = resolve_bing_redirect(raw_link)
+async def fetch_bing_results(session, query, page_num):
+    """
+    Fetch one page of Bing results via the Oxylabs Push-Pull API (no SDK).
+    Returns parallel (titles, links) lists for that page, skipping excluded domains.
+    """
+    if not OXY_USERNAME or not OXY_PASSWORD:
+        raise RuntimeError("Missing OXY_USERNAME / OXY_PASSWORD environment variables.")
+
+    # Rotate through the East-Coast ZIP codes
+    geo = next(_ZIP_ITER)
 
-            domain = urlparse(link).netloc.lower()
-            if domain in EXCLUDED_DOMAINS:
-                print(f"Domain Excluded: {domain}")
-                continue
+    # orjson.dumps gives the JSON-escaped query string as bytes
+    body = _PAYLOAD_TMPL % (orjson.dumps(query), page_num)
 
-            results.append((title, link))
+    job = await _oxy_request(session, "POST", OXY_JOBS_URL, data=body, headers=_JSON_HEADERS)
+    job_id = job.get("id")
+    if not job_id:
+        raise RuntimeError(f"Oxylabs did not return a job id: {str(job)[:300]}")
 
-    return results
+    return await fetch_bing_job(session, job_id)
 
 
 # ===================== WebScrapingAPI (kept for reference; now disabled) =====================
@@ -312,40 +387,89 @@ def fetch_bing_results(query, start, batch_size):
 #         results.append((title, link))
 #     return results
 
-# ===================== Remainder unchanged =====================
 
-def scrape_bing_to_csv(query, output_file, max_results, batch_size):
+async def _scrape_bing_to_csv_async(session, sem, csv_out, query, output_file, page_jobs):
     # Remove existing file so each run starts fresh
     if os.path.exists(output_file):
         os.remove(output_file)
 
     total_written = 0
-    header_written = False
+    seen = set()
 
-    for offset in range(1, max_results, batch_size):
-        try:
-            batch = fetch_bing_results(query, offset, batch_size)
-            if not batch:
-                print(f"No more results at offset {offset}. Stopping.")
-                break
+    async def fetch_page(job_id):
+        # A failed batch submit leaves its exception in place of the job id
+        if isinstance(job_id, Exception):
+            raise job_id
+        async with sem:
+            return await fetch_bing_job(session, job_id)
 
-            # Append this batch to CSV
-            with open(output_file, "a", newline="", encoding="utf-8") as csvfile:
-                writer = csv.writer(csvfile)
-                if not header_written:
-                    writer.writerow(["Page Title", "URL"])
-                    header_written = True
+    # Wait on every page job at once; the shared semaphore bounds how many are polled at a time
+    tasks = [asyncio.ensure_future(fetch_page(job_id)) for job_id in page_jobs]
+    try:
+        # Await in page order so CSV rows keep their SERP rank,
+        # handing each page to the writer thread as soon as it and all earlier pages are in
+        for page_num, task in enumerate(tasks, start=1):
+            try:
+                titles, links = await task
+            except Exception as e:
+                print(f"Error on page {page_num} for '{query}': {e}. Stopping.")
+                break
 
-                for title, link in batch:
-                    total_written += 1
-                    writer.writerow([title, link])
+            if not titles:
+                print(f"No more results at page {page_num} for '{query}'. Stopping.")
+                break
 
-            print(f"Fetched & saved {len(batch)} items from {offset}–{offset+batch_size-1} (total {total_written}).")
+            rows = unseen_rows(titles, links, seen)
+            await csv_out.awrite(output_file, rows)
+            total_written += len(rows)
 
-        except Exception as e:
-            print(f"Error at offset {offset}: {e}. Retrying after delay.")
-            break
-        break
-        # time.sleep(random.uniform(*delay_range))
+            print(f"Fetched & saved {len(rows)} new items from page {page_num} (total {total_written}).")
+    finally:
+        await csv_out.aclose_file(output_file)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
     print(f"\nDone! {total_written} total results saved to {output_file}")
+    return total_written
+
+
+async def _scrape_bing_batch_async(jobs, pages_needed, csv_out):
+    sem = asyncio.Semaphore(OXY_CONCURRENCY)
+    queries = [query for query, _ in jobs]
+    async with aiohttp.ClientSession() as session:
+        # One batch submit per SERP page, covering every query
+        batches = await asyncio.gather(
+            *[submit_bing_batch(session, queries, p) for p in range(1, pages_needed + 1)],
+            return_exceptions=True,
+        )
+        # Map job ids back to queries: page_jobs[i] holds query i's job per page
+        page_jobs = [
+            [ids if isinstance(ids, Exception) else ids[i] for ids in batches]
+            for i in range(len(jobs))
+        ]
+        return await asyncio.gather(*(
+            _scrape_bing_to_csv_async(session, sem, csv_out, query, output_file, page_jobs[i])
+            for i, (query, output_file) in enumerate(jobs)
+        ))
+
+
+def scrape_bing_batch_to_csv(jobs, max_results, batch_size):
+    """
+    Scrape Bing via Oxylabs for many queries at once.
+    jobs is a list of (query, output_file) pairs. Each SERP page is submitted
+    for all queries in one Push-Pull batch call, so there are pages_needed
+    submits rather than one per (query, page). Polling and pulling the jobs
+    share one HTTP session and a budget of OXY_CONCURRENCY jobs at a time. CSV writes for all
+    jobs go through one background CsvWriterThread.
+    batch_size is ignored: Oxylabs pages are fixed at ~10 results each.
+    Returns the number of rows written per job, in job order.
+    """
+    pages_needed = max(1, min(BING_PAGES, math.ceil(max_results / 10.0)))
+    with CsvWriterThread(["Page Title", "URL"]) as csv_out:
+        return asyncio.run(_scrape_bing_batch_async(jobs, pages_needed, csv_out))
+
+
+def scrape_bing_to_csv(query, output_file, max_results, batch_size):
+    """Single-query wrapper around scrape_bing_batch_to_csv."""
+    scrape_bing_batch_to_csv([(query, output_file)], max_results, batch_size)
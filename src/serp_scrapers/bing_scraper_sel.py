@@ -2,17 +2,23 @@
 Bing Search Scraper Module
 
 Provides functions to scrape Bing results with Selenium, including
-proxy rotation and User-Agent rotation. Data is flushed to CSV per page
-so progress is saved incrementally. Intended for import by a
+proxy rotation and User-Agent rotation. Each worker thread keeps one
+Chrome driver (bound to one proxy) alive across pages, and data is
+handed per page to a background CSV writer thread so progress is saved
+incrementally while the next pages load. Intended for import by a
 separate main.py (or other caller).
 
 Dependencies:
-    pip install selenium webdriver_manager
+    pip install selenium webdriver_manager selectolax
 """
-import csv
 import time
 import random
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
+from selectolax.lexbor import LexborHTMLParser
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
@@ -22,6 +28,8 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+from .csv_writer import CsvWriterThread
+
 # List of User-Agent strings to rotate
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
@@ -62,13 +70,66 @@ def build_options(headless: bool = True, proxy: str = None) -> Options:
     return options
 
 
+@lru_cache(maxsize=None)
+def _chromedriver_path() -> str:
+    """Locate (downloading if needed) chromedriver once per process."""
+    return ChromeDriverManager().install()
+
+
+def _fetch_page(driver, query: str, page: int):
+    """
+    Load one Bing SERP page in an already-running driver.
+
+    Returns:
+        (page_results, n_items), or None if no results showed up before the timeout.
+    """
+    wait = WebDriverWait(driver, 10)
+
+    start = (page - 1) * 10 + 1
+    url = (
+        "https://www.bing.com/search?"
+        f"q={query}&first={start}&mkt=en-US&cc=US"
+    )
+    print(f"[Log] Navigating to: {url}")
+    driver.get(url)
+
+    try:
+        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'li.b_algo')))
+    except Exception:
+        print(f"[Log] No results found or timeout on page {page}.")
+        return None
+
+    # Pull the rendered HTML once and parse it locally, rather than paying a
+    # WebDriver round-trip for every title/link/snippet lookup
+    tree = LexborHTMLParser(driver.page_source)
+    items = tree.css('li.b_algo')
+    print(f"[Log] Found {len(items)} items on page {page}")
+
+    page_results = []
+    for item in items:
+        a = item.css_first('h2 a')
+        if a is None:
+            continue
+        title = a.text().strip()
+        link = a.attributes.get('href') or ''
+        p = item.css_first('p')
+        snippet = p.text().strip() if p is not None else ''
+        result = {'title': title, 'url': link, 'snippet': snippet}
+        page_results.append(result)
+
+    return page_results, len(items)
+
+
 def scrape_bing(query: str,
                 proxy_list: list = None,
                 headless: bool = True,
                 output_file: str = None) -> list:
     """
     Scrape all Bing SERP pages for a query, rotating proxies and UAs.
-    Immediately flushes each page's results to CSV if `output_file` is set.
+    Pages are fetched in parallel by one worker per proxy; each worker
+    reuses a single Chrome driver for all of its pages.
+    Each page's results are queued (in page order) to a CsvWriterThread
+    if `output_file` is set.
 
     Args:
         query (str): Search query.
@@ -82,86 +143,83 @@ def scrape_bing(query: str,
     all_results = []
     page = 1
 
-    # Prepare CSV writer if needed
-    writer = None
-    csv_file = None
+    # Prepare CSV writer thread if needed
+    csv_out = None
     if output_file:
-        csv_file = open(output_file, 'w', newline='', encoding='utf-8')
-        writer = csv.DictWriter(csv_file, fieldnames=['title', 'url', 'snippet'])
-        writer.writeheader()
-        print(f"[Log] Output file '{output_file}' opened for writing.")
-
-    print(f"[Log] Beginning scrape for query: '{query}'")
-    while True:
-        print(f"[Log] Starting page {page}")
-        proxy = random.choice(proxy_list) if proxy_list else None
-        options = build_options(headless, proxy)
-        driver = webdriver.Chrome(
-            service=Service(ChromeDriverManager().install()),
-            options=options
-        )
-        wait = WebDriverWait(driver, 10)
-
-        start = (page - 1) * 10 + 1
-        url = (
-            "https://www.bing.com/search?"
-            f"q={query}&first={start}&mkt=en-US&cc=US"
-        )
-        print(f"[Log] Navigating to: {url}")
-        driver.get(url)
-
-        try:
-            wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, 'li.b_algo')))
-        except Exception:
-            print(f"[Log] No results found or timeout on page {page}. Ending.")
-            driver.quit()
-            break
-
-        items = driver.find_elements(By.CSS_SELECTOR, 'li.b_algo')
-        print(f"[Log] Found {len(items)} items on page {page}")
-        if not items:
+        csv_out = CsvWriterThread(['title', 'url', 'snippet'])
+        csv_out.start()
+        print(f"[Log] Writer thread started for output file '{output_file}'.")
+
+    # One worker (and one driver) per proxy; a single proxy-less worker otherwise
+    n_workers = len(proxy_list) if proxy_list else 1
+    proxies = itertools.cycle(proxy_list or [None])
+    local = threading.local()
+    drivers = []
+    drivers_lock = threading.Lock()
+
+    def get_driver():
+        driver = getattr(local, "driver", None)
+        if driver is None:
+            with drivers_lock:
+                proxy = next(proxies)
+            options = build_options(headless, proxy)
+            driver = webdriver.Chrome(
+                service=Service(_chromedriver_path()),
+                options=options
+            )
+            local.driver = driver
+            with drivers_lock:
+                drivers.append(driver)
+        return driver
+
+    def worker(page_num):
+        if page_num > n_workers:
+            delay = random.uniform(1, 3)
+            print(f"[Log] Sleeping for {delay:.2f} seconds before page {page_num}")
+            time.sleep(delay)
+        print(f"[Log] Starting page {page_num}")
+        return _fetch_page(get_driver(), query, page_num)
+
+    print(f"[Log] Beginning scrape for query: '{query}' with {n_workers} worker(s)")
+    try:
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            done = False
+            while not done:
+                window = range(page, page + n_workers)
+                futures = [pool.submit(worker, p) for p in window]
+
+                # Consume in page order; pages past the last one are discarded
+                for p, fut in zip(window, futures):
+                    fetched = fut.result()
+                    if done:
+                        continue
+                    if fetched is None or not fetched[1]:
+                        print(f"[Log] No results on page {p}. Ending.")
+                        done = True
+                        continue
+
+                    page_results, n_items = fetched
+
+                    # Queue this page's results for the writer thread
+                    if csv_out and page_results:
+                        csv_out.write(output_file, [(r['title'], r['url'], r['snippet']) for r in page_results])
+                        print(f"[Log] Queued {len(page_results)} results from page {p} for CSV.")
+
+                    all_results.extend(page_results)
+                    print(f"[Log] Completed page {p}")
+
+                    # Check if this is the last page: if fewer than 10 results, end
+                    if n_items < 10:
+                        print(f"[Log] Detected last page (only {n_items} results). Ending.")
+                        done = True
+
+                page += n_workers
+    finally:
+        for driver in drivers:
             driver.quit()
-            break
-
-        page_results = []
-        for item in items:
-            try:
-                el = item.find_element(By.CSS_SELECTOR, 'h2 a')
-                title = el.text
-                link = el.get_attribute('href')
-            except:
-                continue
-            snippet = ''
-            try:
-                snippet = item.find_element(By.CSS_SELECTOR, 'p').text
-            except:
-                pass
-            result = {'title': title, 'url': link, 'snippet': snippet}
-            page_results.append(result)
-
-        # Write this page's results immediately
-        if writer and page_results:
-            writer.writerows(page_results)
-            csv_file.flush()
-            print(f"[Log] Saved {len(page_results)} results from page {page} to CSV.")
-
-        all_results.extend(page_results)
-        driver.quit()
-        print(f"[Log] Completed page {page}")
-
-        # Check if this is the last page: if fewer than 10 results, end
-        if len(items) < 10:
-            print(f"[Log] Detected last page (only {len(items)} results). Ending.")
-            break
-
-        page += 1
-        delay = random.uniform(1, 3)
-        print(f"[Log] Sleeping for {delay:.2f} seconds before next page")
-        time.sleep(delay)
-
-    if csv_file:
-        csv_file.close()
-        print(f"[Log] CSV file '{output_file}' closed.")
+        if csv_out:
+            csv_out.stop()
+            print(f"[Log] CSV file '{output_file}' closed.")
 
     print(f"[Log] Scraping finished. Total results: {len(all_results)}")
     return all_results
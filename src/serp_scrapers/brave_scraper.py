@@ -1,25 +1,29 @@
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+import orjson
 import json5
 import re
-import http
 import os
-import csv
-import time
+import httpx
+import asyncio
 import random
 
 import base64
 import urllib.parse
-from urllib.parse import urlparse, parse_qs, unquote, urlunparse, urlencode
+from functools import lru_cache
+from urllib.parse import unquote
+
+from .csv_writer import CsvWriterThread
+from .url_utils import is_excluded, url_netloc, drop_tracking_params, unseen_rows
 
 # ————— Configuration ————— #
 delay_range = (1, 2)           # min/max delay between requests in seconds
 
 # A set of domains you know you want to skip
-EXCLUDED_DOMAINS = {
+EXCLUDED_DOMAINS = frozenset({
     "www.zhihu.com",
     "zhihu.com",
     # add more if needed
-}
+})
 
 # WebScrapingAPI credentials (you can also set this in your env)
 WSA_API_KEY = os.getenv("WSA_API_KEY")
@@ -30,37 +34,27 @@ WSA_HOST    = "api.webscrapingapi.com"
 BRAVE_API_KEY = os.getenv("BRAVE_API_KEY")
 BRAVE_API_HOST = "api.search.brave.com"
 
-## Brave
-TRACKING_KEYS = {
-    "utm_source","utm_medium","utm_campaign","utm_term","utm_content",
-    "gclid","gbraid","wbraid","fbclid","msclkid","ocid","cvid","form","spm","ved","ei","oq","sxsrf","sca_esv","ntb"
-}
-
-def _drop_tracking_params(url: str) -> str:
-    try:
-        p = urlparse(url)
-        q = parse_qs(p.query, keep_blank_values=True)
-        q = {k: v for k, v in q.items() if k not in TRACKING_KEYS and not k.startswith("utm_")}
-        return urlunparse((p.scheme, p.netloc, p.path, p.params, urlencode(q, doseq=True), p.fragment))
-    except Exception:
-        return url
+# Max Brave pages in flight at once; all of them share one HTTP/2 connection
+BRAVE_CONCURRENCY = 4
 
-def resolve_brave_redirect(href: str) -> str:
+@lru_cache(maxsize=16384)
+def resolve_brave_redirect(href: str) -> tuple[str, str]:
     """
     Brave result links are typically direct (no redirect hop).
     Still, we normalize & strip tracking params like in your Bing helper.
+    Returns (clean_url, lowercased netloc); stripping params never changes the netloc.
     """
     try:
-        return _drop_tracking_params(href)
+        return drop_tracking_params(href), url_netloc(href)
     except Exception:
-        return href
+        return href, ""
 
 
 # ---------------------------
 # OFFICIAL BRAVE API PATH
 # ---------------------------
 
-def fetch_brave_results_api(query: str, page_index: int, page_size: int):
+async def fetch_brave_results_api(client, query: str, page_index: int, page_size: int):
     """
     Use Brave's official Search API.
     - Endpoint: /res/v1/web/search
@@ -76,7 +70,7 @@ def fetch_brave_results_api(query: str, page_index: int, page_size: int):
     count  = max(1, page_size)
 
     # Build querystring
-    qs = urllib.parse.urlencode({
+    params = {
         "q": query,
         **({"offset": page_index-1} if page_index > 1 else {}),
         "source": "web",
@@ -86,22 +80,20 @@ def fetch_brave_results_api(query: str, page_index: int, page_size: int):
         # "search_lang": "en",
         # "ui_lang": "en",
         # "freshness": "month",
-    })
+    }
 
-    conn = http.client.HTTPSConnection(BRAVE_API_HOST)
     headers = {
         "Accept": "application/json",
         "X-Subscription-Token": BRAVE_API_KEY,
         # "User-Agent": "your-app-name/1.0",  # optional
     }
-    conn.request("GET", f"/res/v1/web/search?{qs}", headers=headers)
-    resp = conn.getresponse()
-    body = resp.read()
+    resp = await client.get("/res/v1/web/search", params=params, headers=headers)
+    body = resp.content
 
-    if resp.status != 200:
+    if resp.status_code != 200:
         # Common cases: 401 (bad token), 402 (no credits), 429 (rate limit)
         # Fall back to WSA scraping if available
-        print(f"Brave API error HTTP {resp.status}: {body[:200]!r}")
+        print(f"Brave API error HTTP {resp.status_code}: {body[:200]!r}")
         return None
 
     try:
@@ -111,7 +103,8 @@ def fetch_brave_results_api(query: str, page_index: int, page_size: int):
         return None
 
     # Extract organic results from API payload
-    results = []
+    titles = []
+    links = []
     web = (data or {}).get("web") or {}
     for item in web.get("results", []):
         title = item.get("title")
@@ -119,24 +112,23 @@ def fetch_brave_results_api(query: str, page_index: int, page_size: int):
         if not title or not url:
             continue
 
-        link = resolve_brave_redirect(url)
-        domain = urlparse(link).netloc.lower()
-        if domain in EXCLUDED_DOMAINS:
+        link, domain = resolve_brave_redirect(url)
+        if is_excluded(domain, EXCLUDED_DOMAINS):
             continue
-        results.append((title, link))
+        titles.append(title)
+        links.append(link)
 
-    time.sleep(random.uniform(*delay_range))
-    return results
+    return titles, links
 
 
 # ---------------------------
 # WSA + HTML FALLBACK PATH
 # ---------------------------
 
-def fetch_brave_results_wsa(query, page_index, page_size):
+async def fetch_brave_results_wsa(client, query, page_index, page_size):
     """
     Fetch one page of *organic* Brave Search results via WebScrapingAPI.
-    Returns up to page_size (title, link) tuples, skipping excluded domains.
+    Returns parallel (titles, links) lists, skipping excluded domains.
 
     Brave SERP markup:
       - Each organic result is a <div class="snippet" data-type="web"> … </div>
@@ -153,97 +145,133 @@ def fetch_brave_results_wsa(query, page_index, page_size):
     )
 
     # Proxied request through WebScrapingAPI
-    conn = http.client.HTTPSConnection(WSA_HOST)
-    params = urllib.parse.urlencode({
+    params = {
         "api_key": WSA_API_KEY,
         "url": brave_url,
         "render_js": False,   # SSR HTML contains results; no need for JS
         # "country": "us",
-    })
-    conn.request("GET", f"/v2?{params}")
-    resp = conn.getresponse()
-    html = resp.read().decode("utf-8")
+    }
+    # Absolute URL overrides the client's Brave base_url
+    resp = await client.get(f"https://{WSA_HOST}/v2", params=params)
 
-    results = get_result_urls_from_html(html=html)
+    # Hand the raw bytes straight to the HTML parser; it decodes UTF-8 itself
+    results = get_result_urls_from_html(html=resp.content)
 
     return results
 
 
-def fetch_brave_results(query, page_index, page_size):
+async def fetch_brave_results(client, query, page_index, page_size):
     """
     Unified entry point:
       - Use Brave official API if BRAVE_API_KEY is set and request succeeds.
       - Otherwise, fall back to WSA+HTML scraper.
+    Each page sleeps its own 1-2s jitter first, so concurrent pages stagger
+    instead of sharing one global delay.
     """
+    await asyncio.sleep(random.uniform(*delay_range))
+
     # Try official API first
-    api_results = fetch_brave_results_api(query, page_index, page_size)
+    api_results = await fetch_brave_results_api(client, query, page_index, page_size)
     if api_results is not None:
         return api_results
 
     # Fallback
-    return fetch_brave_results_wsa(query, page_index, page_size)
+    return await fetch_brave_results_wsa(client, query, page_index, page_size)
 
 
-def scrape_brave_to_csv(query, output_file, max_results, page_size=20):
+async def _scrape_brave_to_csv_async(csv_out, query, output_file, max_results, page_size, concurrency):
     """
-    Iterate Brave pages:
-      - Official API: uses (offset, count)
-      - Fallback (HTML): uses ?offset=(page_index-1)
+    Fetch Brave pages in windows of up to `concurrency` pages over one HTTP/2
+    client, then write each window in page order so rank order is preserved.
     """
     if os.path.exists(output_file):
         os.remove(output_file)
 
     total_written = 0
-    header_written = False
+    seen = set()
     page_index = 1
 
-    # If caller didn't pass a page_size, default to 20 (Brave default page size)
-    page_size = 20
-
-    while total_written < max_results:
-        try:
-            batch = fetch_brave_results(query, page_index, page_size)
-            if not batch:
-                print(f"No more results at page {page_index}. Stopping.")
+    async with httpx.AsyncClient(base_url=f"https://{BRAVE_API_HOST}", http2=True, timeout=30) as client:
+        while total_written < max_results:
+            # Don't fetch more pages than the remaining results can fill
+            pages_left = -(-(max_results - total_written) // page_size)
+            window = range(page_index, page_index + min(concurrency, pages_left))
+            pages = await asyncio.gather(
+                *[fetch_brave_results(client, query, i, page_size) for i in window],
+                return_exceptions=True,
+            )
+
+            done = False
+            for i, res in zip(window, pages):
+                if isinstance(res, Exception):
+                    print(f"Error on page {i}: {res}. Stopping.")
+                    done = True
+                    break
+                titles, links = res
+                if not titles:
+                    print(f"No more results at page {i}. Stopping.")
+                    done = True
+                    break
+
+                rows = unseen_rows(titles, links, seen)[:max_results - total_written]
+                # A page of nothing but repeats means Brave is recycling results;
+                # paging further would only spend more API calls
+                if not rows:
+                    print(f"No new results at page {i}. Stopping.")
+                    done = True
+                    break
+                await csv_out.awrite(output_file, rows)
+                total_written += len(rows)
+
+                print(f"Fetched & saved {len(rows)} new items from page {i} (total {total_written}).")
+                if total_written >= max_results:
+                    break
+
+            if done:
                 break
+            page_index = window.stop
+
+    print(f"\nDone! {total_written} total results saved to {output_file}")
 
-            with open(output_file, "a", newline="", encoding="utf-8") as csvfile:
-                writer = csv.writer(csvfile)
-                if not header_written:
-                    writer.writerow(["Page Title", "URL"])
-                    header_written = True
 
-                for title, link in batch:
-                    writer.writerow([title, link])
-                    total_written += 1
-                    if total_written >= max_results:
-                        break
+def scrape_brave_to_csv(query, output_file, max_results, page_size=20, concurrency=BRAVE_CONCURRENCY):
+    """
+    Iterate Brave pages:
+      - Official API: uses (offset, count)
+      - Fallback (HTML): uses ?offset=(page_index-1)
+    Up to `concurrency` pages are fetched at a time.
+    """
+    # If caller didn't pass a page_size, default to 20 (Brave default page size)
+    page_size = 20
 
-            print(f"Fetched & saved {len(batch)} items from page {page_index} (total {total_written}).")
+    with CsvWriterThread(["Page Title", "URL"]) as csv_out:
+        asyncio.run(_scrape_brave_to_csv_async(csv_out, query, output_file, max_results, page_size, max(1, concurrency)))
 
-            page_index += 1
-        except Exception as e:
-            print(f"Error on page {page_index}: {e}. Retrying after delay.")
-            break
-        time.sleep(random.uniform(*delay_range))
 
-    print(f"\nDone! {total_written} total results saved to {output_file}")
+# JS-only tokens in Brave's embedded `web:` object, normalized before JSON parsing
+_RE_VOID0 = re.compile(r"\bvoid\s+0\b")
+_RE_UNDEF = re.compile(r"\bundefined\b")
+_RE_TRAIL = re.compile(r",(\s*[}\]])")
 
+# The only characters that can change string/brace state in _extract_balanced_object
+_TOKEN_RE = re.compile(r"[\"'{}\\]")
 
 def _extract_balanced_object(text: str, start_index: int) -> str:
+    # Jump between quote/brace/backslash positions with the regex engine
+    # instead of stepping through every character in Python.
     depth = 0
-    i = start_index
     in_string = False
     quote = None
-    escape = False
+    escaped_at = -1  # index of the character escaped by the last backslash
 
-    while i < len(text):
-        ch = text[i]
+    for m in _TOKEN_RE.finditer(text, start_index):
+        i = m.start()
+        ch = m.group()
         if in_string:
-            if escape:
-                escape = False
-            elif ch == '\\':
-                escape = True
+            if i == escaped_at:
+                continue
+            if ch == '\\':
+                escaped_at = i + 1
             elif ch == quote:
                 in_string = False
         else:
@@ -256,23 +284,30 @@ def _extract_balanced_object(text: str, start_index: int) -> str:
                 depth -= 1
                 if depth == 0:
                     return text[start_index:i+1]
-        i += 1
 
     raise ValueError("Unbalanced braces while extracting object.")
 
-def get_result_urls_from_html(html: str) -> list[tuple[str, str]]:
+# Scripts that can hold the SSR results object, either as a JS literal or JSON
+_WEB_SCRIPT_SELECTOR = 'script:lexbor-contains("web:"), script:lexbor-contains(\'"web":\')'
+
+
+def get_result_urls_from_html(html: bytes) -> tuple[list[str], list[str]]:
     """
-    Parse Brave's SSR HTML (fallback path) and return list of (title, url) tuples.
+    Parse Brave's SSR HTML bytes (fallback path) and return parallel (titles, urls) lists.
     Applies tracking/redirect cleanup and domain exclusion.
     """
-    soup = BeautifulSoup(html, "html.parser")
+    tree = LexborHTMLParser(html)
 
     # Prefer the embedded JSON ('web:' object); it's more stable than CSS selectors.
-    for script in soup.find_all("script"):
-        txt = script.string or script.text or ""
+    # Let lexbor filter scripts natively so only the one or two carrying the
+    # `web:` object ever get materialized as Python strings
+    for script in tree.css(_WEB_SCRIPT_SELECTOR):
+        txt = script.text() or ""
         idx = txt.find("web:")
         if idx == -1:
-            continue
+            idx = txt.find('"web":')
+            if idx == -1:
+                continue
 
         brace_idx = txt.find("{", idx)
         if brace_idx == -1:
@@ -280,29 +315,34 @@ def get_result_urls_from_html(html: str) -> list[tuple[str, str]]:
 
         web_obj_text = _extract_balanced_object(txt, brace_idx)
 
-        # Normalize common JS-only tokens so JSON5 can parse it
+        # Normalize common JS-only tokens so JSON (or JSON5) can parse it
         cleaned = web_obj_text
-        cleaned = re.sub(r"\bvoid\s+0\b", "null", cleaned)     # void 0 -> null
-        cleaned = re.sub(r"\bundefined\b", "null", cleaned)    # undefined -> null
-        cleaned = re.sub(r",(\s*[}\]])", r"\1", cleaned)       # drop trailing commas
+        cleaned = _RE_VOID0.sub("null", cleaned)     # void 0 -> null
+        cleaned = _RE_UNDEF.sub("null", cleaned)     # undefined -> null
+        cleaned = _RE_TRAIL.sub(r"\1", cleaned)      # drop trailing commas
 
+        # Strict JSON goes through orjson; JS object literals (unquoted keys etc.) need json5
         try:
-            web_obj = json5.loads(cleaned)
-        except Exception as e:
-            raise RuntimeError(f"Failed to parse `web` object: {e}")
+            web_obj = orjson.loads(cleaned)
+        except orjson.JSONDecodeError:
+            try:
+                web_obj = json5.loads(cleaned)
+            except Exception as e:
+                raise RuntimeError(f"Failed to parse `web` object: {e}")
 
         results = web_obj.get("results")
         if isinstance(results, list):
-            tuples: list[tuple[str, str]] = []
+            titles: list[str] = []
+            links: list[str] = []
             for item in results:
                 if isinstance(item, dict) and isinstance(item.get("url"), str):
                     title = item.get("title") or ""
-                    link  = resolve_brave_redirect(item["url"])
-                    domain = urlparse(link).netloc.lower()
-                    if domain in EXCLUDED_DOMAINS:
+                    link, domain = resolve_brave_redirect(item["url"])
+                    if is_excluded(domain, EXCLUDED_DOMAINS):
                         continue
-                    tuples.append((title, link))
-            return tuples
+                    titles.append(title)
+                    links.append(link)
+            return titles, links
 
     # If we get here, nothing matched — return empty for caller to handle.
-    return []
+    return [], []
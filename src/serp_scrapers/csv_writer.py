@@ -0,0 +1,121 @@
+"""
+Shared CSV writer thread for the SERP scrapers.
+
+Scrapers push each page's rows onto a bounded queue as one item and keep
+fetching, while one background thread does the writerows() + flush() work.
+A full queue (maxsize pages) blocks the producer, which keeps a slow disk
+from piling up rows in memory. Because of that, asyncio producers must use
+awrite()/aclose_file(), which run the blocking put in a worker thread
+instead of stalling the event loop.
+
+Each page is queued as (output_file, rows), so one writer can serve many
+CSVs (e.g. a whole Bing batch). A CSV is opened lazily on its first row,
+starting with the header, and closed by close_file() or stop().
+"""
+import asyncio
+import csv
+import queue
+import threading
+
+# Write buffer for the scrapers' CSV outputs
+CSV_BUFFERING = 256 * 1024
+
+
+class CsvWriterThread(threading.Thread):
+    def __init__(self, header, maxsize=256, chunk_size=32, buffering=CSV_BUFFERING):
+        super().__init__(daemon=True)
+        self.header = header
+        self.chunk_size = chunk_size
+        self.buffering = buffering
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self._files = {}
+
+    def write(self, output_file, rows):
+        """Queue a page of rows for output_file (blocks while the queue is full)."""
+        if rows:
+            self.queue.put((output_file, rows))
+
+    def close_file(self, output_file):
+        """Close output_file once every row queued before this call is written."""
+        self.queue.put((output_file, None))
+
+    async def awrite(self, output_file, rows):
+        """write() for asyncio callers."""
+        await asyncio.to_thread(self.write, output_file, rows)
+
+    async def aclose_file(self, output_file):
+        """close_file() for asyncio callers."""
+        await asyncio.to_thread(self.close_file, output_file)
+
+    def stop(self):
+        """Flush everything still queued, close all files and join the thread."""
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _writer(self, output_file):
+        entry = self._files.get(output_file)
+        if entry is None:
+            # Large buffer: rows only hit the OS on the explicit flush() per chunk
+            f = open(output_file, "w", newline="", encoding="utf-8", buffering=self.buffering)
+            w = csv.writer(f)
+            w.writerow(self.header)
+            entry = self._files[output_file] = (f, w)
+        return entry
+
+    def _write_chunk(self, chunk):
+        # Group the chunk per file, keeping the row order within each file
+        pending = {}
+        for output_file, rows in chunk:
+            if rows is not None:
+                pending.setdefault(output_file, []).append(rows)
+                continue
+            pages = pending.pop(output_file, None)
+            if pages:
+                f, w = self._writer(output_file)
+                for rows in pages:
+                    w.writerows(rows)
+            entry = self._files.pop(output_file, None)
+            if entry is not None:
+                entry[0].close()
+
+        for output_file, pages in pending.items():
+            f, w = self._writer(output_file)
+            for rows in pages:
+                w.writerows(rows)
+            f.flush()
+
+    def run(self):
+        done = False
+        while not done:
+            # Block for one page, then grab whatever else is ready up to chunk_size
+            chunk = [self.queue.get()]
+            while len(chunk) < self.chunk_size:
+                try:
+                    chunk.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in chunk:
+                chunk = chunk[:chunk.index(None)]
+                done = True
+
+            # Keep draining after a failure so producers never block on a full queue
+            if self.error is None:
+                try:
+                    self._write_chunk(chunk)
+                except Exception as e:
+                    self.error = e
+
+        for f, _ in self._files.values():
+            f.close()
+        self._files.clear()
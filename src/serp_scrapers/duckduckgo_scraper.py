@@ -1,63 +1,80 @@
-from bs4 import BeautifulSoup
-import json5
-import re
-import http
+import lxml.html
+from lxml import etree
 import os
 import csv
-import time
 import random
+import asyncio
+import httpx
 
-import base64
-import urllib.parse
-from urllib.parse import urlparse, parse_qs, unquote, urlunparse, urlencode
+from urllib.parse import urlparse, parse_qs, unquote, unquote_plus, urlencode
+
+from .csv_writer import CSV_BUFFERING
+from .url_utils import is_excluded, drop_tracking_params
 
 # ————— Configuration ————— #
 delay_range = (1, 2)           # min/max delay between requests in seconds
 
 # A set of domains you know you want to skip
-EXCLUDED_DOMAINS = {
+EXCLUDED_DOMAINS = frozenset({
     "www.zhihu.com",
     "zhihu.com",
     # add more if needed
-}
+})
 
 # WebScrapingAPI credentials (you can also set this in your env)
 WSA_API_KEY = os.getenv("WSA_API_KEY")
 WSA_HOST    = "api.webscrapingapi.com"
 
-## Shared
-TRACKING_KEYS = {
-    "utm_source","utm_medium","utm_campaign","utm_term","utm_content",
-    "gclid","gbraid","wbraid","fbclid","msclkid","ocid","cvid","form","spm","ved","ei","oq","sxsrf","sca_esv","ntb"
-}
-
-def _drop_tracking_params(url: str) -> str:
-    try:
-        p = urlparse(url)
-        q = parse_qs(p.query, keep_blank_values=True)
-        q = {k: v for k, v in q.items() if k not in TRACKING_KEYS and not k.startswith("utm_")}
-        return urlunparse((p.scheme, p.netloc, p.path, p.params, urlencode(q, doseq=True), p.fragment))
-    except Exception:
-        return url
+# Max DDG pages in flight at once (all through one pooled client)
+DDG_CONCURRENCY = 4
 
 # ————— DuckDuckGo-specific helpers ————— #
 
-def resolve_duckduckgo_redirect(href: str) -> str:
+_DDG_WRAPPER_PREFIXES = ("https://duckduckgo.com/l/?", "//duckduckgo.com/l/?", "http://duckduckgo.com/l/?")
+
+def _fast_netloc(url: str) -> str:
+    """Lowercased netloc of an absolute URL, sliced out without urlparse."""
+    i = url.find("//")
+    if i < 0:
+        return urlparse(url).netloc.lower()
+    i += 2
+    end = len(url)
+    for sep in "/?#":
+        j = url.find(sep, i)
+        if 0 <= j < end:
+            end = j
+    return url[i:end].lower()
+
+def resolve_duckduckgo_redirect(href: str) -> tuple[str, str]:
     """
     DDG often wraps result links like:
       https://duckduckgo.com/l/?kh=-1&uddg=<URLENCODED_TARGET>
     We unwrap to the direct destination and then strip tracking params.
+    Returns (link, lowercased netloc) so callers don't re-parse for the domain check.
     """
+    # Fast path for the usual wrapper: slice uddg out of the string directly
+    if href.startswith(_DDG_WRAPPER_PREFIXES):
+        i = href.find("?uddg=")
+        if i < 0:
+            i = href.find("&uddg=")
+        if i >= 0:
+            i += 6
+            j = href.find("&", i)
+            # Same decoding as parse_qs + unquote below
+            real = unquote(unquote_plus(href[i:j] if j >= 0 else href[i:]))
+            return drop_tracking_params(real), _fast_netloc(real)
+
     try:
         p = urlparse(href)
         if p.netloc.endswith("duckduckgo.com") and p.path.startswith("/l/"):
             q = parse_qs(p.query)
             if "uddg" in q and q["uddg"]:
                 real = unquote(q["uddg"][0])
-                return _drop_tracking_params(real)
-        return _drop_tracking_params(href)
+                return drop_tracking_params(real), urlparse(real).netloc.lower()
+        # Dropping query params never changes the netloc
+        return drop_tracking_params(href), p.netloc.lower()
     except Exception:
-        return href
+        return href, ""
 
 
 def _build_ddg_url(query: str, page_index: int) -> str:
@@ -79,24 +96,37 @@ def _build_ddg_url(query: str, page_index: int) -> str:
     )
 
 
-def get_ddg_results_from_html(html: str) -> list[tuple[str, str]]:
+# Without an explicit encoding libxml2 would guess Latin-1 for bytes lacking a <meta charset>
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+# XPath equivalents of "a.result__a[href]" and 'h2 a[data-testid="result-title-a"][href]'
+_XP_RESULT_A = etree.XPath('//a[contains(concat(" ", normalize-space(@class), " "), " result__a ") and @href]')
+_XP_RESULT_TITLE_A = etree.XPath('//h2//a[@data-testid="result-title-a" and @href]')
+
+
+def get_ddg_results_from_html(html: bytes) -> list[tuple[str, str]]:
     """
     Parse DDG /html/ SERP. Organic results render as anchors with:
       <a class="result__a" href="...">Title</a>
     On newer layouts there may also be:
       <h2 ...><a data-testid="result-title-a" ...>Title</a></h2>
     We support both.
+    Takes the raw response bytes; libxml2 decodes them as UTF-8 itself.
     """
-    soup = BeautifulSoup(html, "html.parser")
+    if not html or not html.strip():
+        return []
+    try:
+        tree = lxml.html.fromstring(html, parser=_HTML_PARSER)
+    except etree.ParserError:
+        # Non-blank but element-less body (e.g. just a comment): "Document is empty"
+        return []
     results = []
 
     # Primary: classic /html/ markup
-    for a in soup.select("a.result__a[href]"):
-        title = a.get_text(strip=True)
-        link  = resolve_duckduckgo_redirect(a["href"])
-
-        domain = urlparse(link).netloc.lower()
-        if domain in EXCLUDED_DOMAINS:
+    for a in _XP_RESULT_A(tree):
+        title = a.text_content().strip()
+        link, domain = resolve_duckduckgo_redirect(a.get("href"))
+        if is_excluded(domain, EXCLUDED_DOMAINS):
             continue
 
         if title and link:
@@ -104,12 +134,10 @@ def get_ddg_results_from_html(html: str) -> list[tuple[str, str]]:
 
     # Fallback: some variants use data-testid attributes
     if not results:
-        for a in soup.select('h2 a[data-testid="result-title-a"][href]'):
-            title = a.get_text(strip=True)
-            link  = resolve_duckduckgo_redirect(a["href"])
-
-            domain = urlparse(link).netloc.lower()
-            if domain in EXCLUDED_DOMAINS:
+        for a in _XP_RESULT_TITLE_A(tree):
+            title = a.text_content().strip()
+            link, domain = resolve_duckduckgo_redirect(a.get("href"))
+            if is_excluded(domain, EXCLUDED_DOMAINS):
                 continue
 
             if title and link:
@@ -118,7 +146,7 @@ def get_ddg_results_from_html(html: str) -> list[tuple[str, str]]:
     return results
 
 
-def fetch_duckduckgo_results(query: str, page_index: int, batch_size: int) -> list[tuple[str, str]]:
+async def fetch_duckduckgo_results(client, query: str, page_index: int, batch_size: int) -> list[tuple[str, str]]:
     """
     Fetch one page of *organic* DuckDuckGo results via WebScrapingAPI.
     Returns up to batch_size (title, link) tuples, skipping excluded domains.
@@ -126,64 +154,82 @@ def fetch_duckduckgo_results(query: str, page_index: int, batch_size: int) -> li
     ddg_url = _build_ddg_url(query, page_index)
 
     # Proxied request through WebScrapingAPI
-    conn = http.client.HTTPSConnection(WSA_HOST)
     params = urlencode({
         "api_key": WSA_API_KEY,
         "url": ddg_url,
         "render_js": False,   # /html/ is server-rendered
         # Optional geo: "country": "us",
     })
-    conn.request("GET", f"/v2?{params}")
-    resp = conn.getresponse()
-    html = resp.read().decode("utf-8")
-
-    all_results = get_ddg_results_from_html(html=html)
+    resp = await client.get(f"/v2?{params}")
+    # Hand the raw bytes straight to the parser instead of decoding to str first
+    all_results = get_ddg_results_from_html(html=resp.content)
 
     # Respect requested batch_size (even though /html/ ≈ 30/pg)
     results = all_results[:batch_size] if batch_size else all_results
 
-    time.sleep(random.uniform(*delay_range))  # be nice
     return results
 
 
+async def _fetch_ddg_rows(query: str, max_results: int, page_size: int):
+    """
+    Fetch DDG pages in windows of up to DDG_CONCURRENCY pages over one pooled
+    client, stopping at the first empty or failed page so pages that don't
+    exist never cost a WSA call beyond the window that found the end.
+    Returns the (title, link) rows in page order, capped at max_results.
+    """
+    rows = []
+    page_index = 1
+
+    async with httpx.AsyncClient(base_url=f"https://{WSA_HOST}", timeout=60) as client:
+        async def fetch_page(i):
+            await asyncio.sleep(random.uniform(*delay_range))  # be nice
+            return await fetch_duckduckgo_results(client, query, i, page_size)
+
+        while len(rows) < max_results:
+            # Don't fetch more pages than the remaining results can fill
+            pages_left = -(-(max_results - len(rows)) // page_size)
+            window = range(page_index, page_index + min(DDG_CONCURRENCY, pages_left))
+            pages = await asyncio.gather(*[fetch_page(i) for i in window], return_exceptions=True)
+
+            done = False
+            for i, batch in zip(window, pages):
+                if isinstance(batch, Exception):
+                    print(f"Error on page {i}: {batch}. Stopping.")
+                    done = True
+                    break
+                if not batch:
+                    print(f"No more results at page {i}. Stopping.")
+                    done = True
+                    break
+                rows.extend(batch[:max_results - len(rows)])
+                print(f"Fetched {len(batch)} items from page {i} (total {len(rows)}).")
+
+            if done:
+                break
+            page_index = window.stop
+
+    return rows
+
+
 def scrape_duckduckgo_to_csv(query: str, output_file: str, max_results: int, page_size: int):
     """
-    Iterate DDG pages using the 0-based 's' (offset) param (30 results/page).
+    Fetch DDG pages using the 0-based 's' (offset) param (30 results/page).
+    Pages are requested DDG_CONCURRENCY at a time, stopping at the first
+    empty page, and the CSV is written in one pass, in page order.
     The function mirrors your Brave routine (including CSV schema).
     """
     if os.path.exists(output_file):
         os.remove(output_file)
 
-    total_written = 0
-    header_written = False
-    page_index = 1
-
     # OVERRIDE USER (DDG /html/ returns ~30 organic per page)
     page_size = 30
 
-    while total_written < max_results:
-        try:
-            batch = fetch_duckduckgo_results(query, page_index, page_size)
-            if not batch:
-                print(f"No more results at page {page_index}. Stopping.")
-                break
+    rows = asyncio.run(_fetch_ddg_rows(query, max_results, page_size))
+
+    if rows:
+        with open(output_file, "w", newline="", encoding="utf-8", buffering=CSV_BUFFERING) as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["Page Title", "URL"])
+            writer.writerows(rows)
 
-            with open(output_file, "a", newline="", encoding="utf-8") as csvfile:
-                writer = csv.writer(csvfile)
-                if not header_written:
-                    writer.writerow(["Page Title", "URL"])
-                    header_written = True
-
-                for title, link in batch:
-                    writer.writerow([title, link])
-                    total_written += 1
-                    if total_written >= max_results:
-                        break
-
-            print(f"Fetched & saved {len(batch)} items from page {page_index} (total {total_written}).")
-            page_index += 1
-        except Exception as e:
-            print(f"Error on page {page_index}: {e}. Retrying after delay.")
-        time.sleep(random.uniform(*delay_range))
-
-    print(f"\nDone! {total_written} total results saved to {output_file}")
+    print(f"\nDone! {len(rows)} total results saved to {output_file}")
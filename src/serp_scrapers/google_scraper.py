@@ -3,9 +3,12 @@ import math
 import time
 import csv
 import base64
-import json
+import orjson
 import requests
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from .csv_writer import CSV_BUFFERING
 
 # —— Configuration —— #
 SERPER_ENDPOINT = "https://google.serper.dev/search"
@@ -19,6 +22,11 @@ OXY_ENDPOINT    = "https://realtime.oxylabs.io/v1/queries"
 OXY_USERNAME = os.getenv("OXY_USERNAME")
 OXY_PASSWORD = os.getenv("OXY_PASSWORD")
 
+# One pooled session for every Serper / Oxylabs call, so consecutive
+# queries and pages reuse open TLS connections
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
 # -----------------------------
 # Serper.dev (existing)
 # -----------------------------
@@ -38,13 +46,13 @@ def fetch_serper_page(query, page, page_size):
     }
 
     try:
-        resp = requests.post(SERPER_ENDPOINT, json=payload, headers=headers, timeout=20)
+        resp = _SESSION.post(SERPER_ENDPOINT, json=payload, headers=headers, timeout=20)
         resp.raise_for_status()
     except requests.exceptions.HTTPError as e:
         # If it's a Bad Request because num is too large, retry with num=20
         if resp is not None and resp.status_code == 400 and page_size > 20:
             retry_payload = {"q": query, "page": page, "num": 20}
-            resp = requests.post(SERPER_ENDPOINT, json=retry_payload, headers=headers, timeout=20)
+            resp = _SESSION.post(SERPER_ENDPOINT, json=retry_payload, headers=headers, timeout=20)
             resp.raise_for_status()
         else:
             raise
@@ -75,6 +83,10 @@ def _oxylabs_auth_header():
     return {"Authorization": f"Basic {token}"}
 
 
+# Result sections scanned (in order) when Oxylabs returns no parsed "entities"
+_OXY_ORGANIC_KEYS = ("organic", "main", "top_stories", "people_also_ask")
+
+
 def fetch_oxylabs_pages(
     query,
     pages,                 # number of pages to fetch (we'll pass ceil(max_results/10))
@@ -117,10 +129,11 @@ def fetch_oxylabs_pages(
     data = None
     for attempt in (1, 2):
         try:
-            resp = requests.post(OXY_ENDPOINT, headers=headers, json=payload, timeout=220)
+            resp = _SESSION.post(OXY_ENDPOINT, headers=headers, json=payload, timeout=220)
             resp.raise_for_status()
             try:
-                data = resp.json()
+                # orjson parses the raw body bytes; JSONDecodeError is a ValueError
+                data = orjson.loads(resp.content)
             except ValueError:
                 # Non-JSON body (empty, HTML error page, etc.)
                 if attempt == 1:
@@ -154,19 +167,18 @@ def fetch_oxylabs_pages(
         if not organic:
             content = r.get("content") or {}
             results_dict = content.get("results") or {}
-            candidate_lists = []
-            for key in ("organic", "main", "top_stories", "people_also_ask"):
-                v = results_dict.get(key)
-                if isinstance(v, list):
-                    candidate_lists.append(v)
-            for clist in candidate_lists:
-                for entry in clist:
-                    if isinstance(entry, dict) and ("title" in entry) and ("url" in entry or "link" in entry):
-                        organic.append(entry)
+            organic = [
+                entry
+                for key in _OXY_ORGANIC_KEYS
+                if isinstance(v := results_dict.get(key), list)
+                for entry in v
+                if isinstance(entry, dict) and "title" in entry and ("url" in entry or "link" in entry)
+            ]
 
         for entry in organic:
-            title = entry.get("title")
-            link = entry.get("url") or entry.get("link")
+            get = entry.get
+            title = get("title")
+            link = get("url") or get("link")
             if title and link:
                 items.append((title, link))
 
@@ -193,7 +205,6 @@ def scrape_google_to_csv(query, max_results, page_size, output_file, *, provider
         os.remove(output_file)
 
     total_written = 0
-    header_written = False
 
     if provider == "oxylabs":
         # One multi-page request
@@ -205,53 +216,53 @@ def scrape_google_to_csv(query, max_results, page_size, output_file, *, provider
             print(f"\nDone! {total_written} total results saved to {output_file}")
             return
 
-        with open(output_file, "a", newline="", encoding="utf-8") as csvfile:
+        rows = batch[:max_results]
+        with open(output_file, "w", newline="", encoding="utf-8", buffering=CSV_BUFFERING) as csvfile:
             writer = csv.writer(csvfile)
-            if not header_written:
-                writer.writerow(["Page Title", "URL"])
-                header_written = True
-
-            for title, link in batch[:max_results]:
-                writer.writerow([title, link])
-                total_written += 1
+            writer.writerow(["Page Title", "URL"])
+            writer.writerows(rows)
+        total_written = len(rows)
 
         print(f"[oxylabs] Saved {total_written} items (requested pages={pages_needed}, limit=10).")
 
     elif provider == "serper":
         # Original paging logic for Serper
         pages_needed = (max_results + page_size - 1) // page_size
-        for page in range(1, pages_needed + 1):
-            try:
-                current_page_size = page_size
-                batch = fetch_serper_page(query, page, current_page_size)
-                if not batch:
-                    print(f"No results returned on page {page}. Stopping.")
-                    break
-
-                with open(output_file, "a", newline="", encoding="utf-8") as csvfile:
-                    writer = csv.writer(csvfile)
-                    if not header_written:
+        csvfile = None
+        try:
+            for page in range(1, pages_needed + 1):
+                try:
+                    current_page_size = page_size
+                    batch = fetch_serper_page(query, page, current_page_size)
+                    if not batch:
+                        print(f"No results returned on page {page}. Stopping.")
+                        break
+
+                    # Open the CSV once, on the first non-empty page, and keep it for every page
+                    if csvfile is None:
+                        csvfile = open(output_file, "w", newline="", encoding="utf-8", buffering=CSV_BUFFERING)
+                        writer = csv.writer(csvfile)
                         writer.writerow(["Page Title", "URL"])
-                        header_written = True
-
-                    for title, link in batch:
-                        total_written += 1
-                        writer.writerow([title, link])
-                        if total_written >= max_results:
-                            break
-
-                start_idx = (page - 1) * current_page_size + 1
-                end_idx   = start_idx + len(batch) - 1
-                print(f"[serper] Page {page}: saved {len(batch)} items ({start_idx}–{end_idx}, total {total_written}).")
-
-                if total_written >= max_results:
-                    print("Reached max_results limit.")
-                    break
-
-            except Exception as e:
-                print(f"Error on page {page}: {e}.")
-                # Optionally backoff here
-                # time.sleep(__import__("random").uniform(*delay_range))
+
+                    rows = batch[:max_results - total_written]
+                    writer.writerows(rows)
+                    total_written += len(rows)
+
+                    start_idx = (page - 1) * current_page_size + 1
+                    end_idx   = start_idx + len(batch) - 1
+                    print(f"[serper] Page {page}: saved {len(batch)} items ({start_idx}–{end_idx}, total {total_written}).")
+
+                    if total_written >= max_results:
+                        print("Reached max_results limit.")
+                        break
+
+                except Exception as e:
+                    print(f"Error on page {page}: {e}.")
+                    # Optionally backoff here
+                    # time.sleep(__import__("random").uniform(*delay_range))
+        finally:
+            if csvfile is not None:
+                csvfile.close()
 
     else:
         raise ValueError(f"Unknown provider: {provider}")
@@ -0,0 +1,91 @@
+"""
+URL helpers shared by the SERP scrapers: tracking-param stripping, netloc
+lookup, excluded-domain checks and per-query dedupe of result rows.
+
+The helpers are pure, and the same hrefs recur across pages and queries,
+so the parsing ones are memoized.
+"""
+from functools import lru_cache
+from urllib.parse import urlsplit
+from urllib3.util.url import parse_url as _fast_parse
+from urllib3.exceptions import LocationParseError
+
+TRACKING_KEYS = frozenset({
+    "utm_source","utm_medium","utm_campaign","utm_term","utm_content",
+    "gclid","gbraid","wbraid","fbclid","msclkid","ocid","cvid","form","spm","ved","ei","oq","sxsrf","sca_esv","ntb"
+})
+
+# Substrings that must appear in a query string for it to carry any tracking key.
+# No "=" on the end, so bare keys (e.g. "?ei") are caught too; a false hit like
+# "format" just falls through to the exact per-pair check.
+_TRACKING_MARKERS = tuple(k for k in TRACKING_KEYS if not k.startswith("utm_")) + ("utm_",)
+
+
+def is_excluded(netloc: str, excluded_domains) -> bool:
+    """True if netloc, or any parent domain of it, is in excluded_domains."""
+    while True:
+        if netloc in excluded_domains:
+            return True
+        dot = netloc.find(".")
+        if dot < 0:
+            return False
+        netloc = netloc[dot + 1:]
+
+
+@lru_cache(maxsize=65536)
+def split_url(url: str) -> tuple[str, str, str, str, str]:
+    """
+    Split url into (scheme, netloc, path, query, fragment) once per distinct URL.
+    urllib3's parser is quicker than urlparse; stdlib is only the fallback
+    for URLs it rejects.
+    """
+    try:
+        u = _fast_parse(url)
+        return u.scheme or "", u.netloc or "", u.path or "", u.query or "", u.fragment or ""
+    except LocationParseError:
+        return tuple(urlsplit(url))
+
+
+def url_netloc(url: str) -> str:
+    return split_url(url)[1].lower()
+
+
+@lru_cache(maxsize=16384)
+def drop_tracking_params(url: str) -> str:
+    # Slice the query straight out of the string so the path and fragment are
+    # kept byte-for-byte; a "?" after "#" belongs to the fragment
+    q_idx = url.find("?")
+    if q_idx < 0:
+        return url
+    end = url.find("#")
+    if 0 <= end < q_idx:
+        return url
+    if end < 0:
+        end = len(url)
+    query = url[q_idx + 1:end]
+    # Fast path: most result URLs carry no tracking params, so skip the rebuild
+    if not any(m in query for m in _TRACKING_MARKERS):
+        return url
+    # Keep the surviving key=value pairs byte-for-byte rather than decoding
+    # them with parse_qs and re-encoding with urlencode
+    kept = []
+    for pair in query.split("&"):
+        eq = pair.find("=")
+        key = pair[:eq] if eq != -1 else pair
+        if key not in TRACKING_KEYS and not key.startswith("utm_"):
+            kept.append(pair)
+    qs = "&".join(kept)
+    return url[:q_idx] + ("?" + qs if qs else "") + url[end:]
+
+
+def unseen_rows(titles, links, seen):
+    """
+    Pair up titles/links, dropping any link already written for this query
+    (the same result often repeats across pages). Records new links in seen.
+    """
+    rows = []
+    for title, link in zip(titles, links):
+        if link not in seen:
+            seen.add(link)
+            rows.append((title, link))
+    return rows
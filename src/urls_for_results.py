@@ -14,17 +14,63 @@ URL fields in the output are standardized to:
   - cites    : cited/given URLs
 """
 
+import io
+import os
 import re
 import json
+import orjson
 import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
 
 # Use your current parser helpers
 from chatgpt_scraper.har_parser import har_parser
 
 # Match result subdirs like: network-logs-prompt-249 or network-logs-prompt-249_20250814_011917
 RESULTS_DIR_PATTERN = re.compile(r"^network-logs-prompt-(?P<prompt_id>\d+)(?:_.*)?$", re.I)
+# HAR files inside datasets/<category>/*hars*/
+HAR_FILE_PATTERN = re.compile(r"^network-logs-prompt-(?P<prompt_id>\d+)\.har$")
+
+
+def _har_dir_sort_key(category: str):
+    # Prefer *_gpt-5* dir when category hints GPT-5
+    prefer_gpt5 = ("gpt-5" in category.lower()) or ("gpt5" in category.lower())
+
+    def sort_key(name: str):
+        n = name.lower()
+        # if prefer_gpt5: put non-gpt dirs later
+        return (prefer_gpt5 and not ("gpt" in n), n)
+
+    return sort_key
+
+
+def build_har_index(datasets_root: Optional[Path]) -> Dict[Tuple[str, str], List[Path]]:
+    """
+    Walk datasets/<category>/*hars*/ once and map (category, prompt_id) to
+    its network-logs-prompt-<ID>.har paths, best match first (the same
+    order find_har_for_results_dir used to probe the directories in).
+    """
+    har_index: Dict[Tuple[str, str], List[Path]] = defaultdict(list)
+    if not datasets_root or not datasets_root.is_dir():
+        return har_index
+
+    with os.scandir(datasets_root) as cats:
+        cat_entries = [c for c in cats if c.is_dir()]
+    for cat in cat_entries:
+        with os.scandir(cat.path) as subdirs:
+            har_dirs = [d for d in subdirs if d.is_dir() and "hars" in d.name.lower()]
+        sort_key = _har_dir_sort_key(cat.name)
+        for hd in sorted(har_dirs, key=lambda d: sort_key(d.name)):
+            with os.scandir(hd.path) as files:
+                for f in files:
+                    m = HAR_FILE_PATTERN.match(f.name)
+                    if m:
+                        har_index[(cat.name, m.group("prompt_id"))].append(Path(f.path))
+    return har_index
 
 
 def find_har_for_results_dir(
@@ -32,6 +78,7 @@ def find_har_for_results_dir(
     results_root: Path,
     datasets_root: Optional[Path],
     prompt_id: str,
+    har_index: Optional[Dict[Tuple[str, str], List[Path]]] = None,
 ) -> List[Path]:
     """
     Return [<exact har path>] or [].
@@ -39,6 +86,9 @@ def find_har_for_results_dir(
     Mapping (timestamp ignored):
       results/<category>/network-logs-prompt-<ID>_<ANY>/
       -> datasets/<category>/*hars*/network-logs-prompt-<ID>.har
+
+    Pass a build_har_index() result when resolving many folders; otherwise
+    the datasets tree is indexed on the spot.
     """
     # Determine <category> from results path
     try:
@@ -47,24 +97,12 @@ def find_har_for_results_dir(
     except Exception:
         category = rdir.parent.name
 
-    # Search datasets/<category>/*hars*/network-logs-prompt-<ID>.har
-    if datasets_root:
-        cat_dir = datasets_root / category
-        if cat_dir.exists():
-            har_dirs = [p for p in cat_dir.iterdir() if p.is_dir() and "hars" in p.name.lower()]
-
-            # Prefer *_gpt-5* dir when category hints GPT-5
-            prefer_gpt5 = ("gpt-5" in category.lower()) or ("gpt5" in category.lower())
-
-            def sort_key(p: Path):
-                n = p.name.lower()
-                # if prefer_gpt5: put non-gpt dirs later
-                return (prefer_gpt5 and not ("gpt" in n), n)
-
-            for hd in sorted(har_dirs, key=sort_key):
-                hp = hd / f"network-logs-prompt-{prompt_id}.har"
-                if hp.exists():
-                    return [hp.resolve()]
+    # Look up datasets/<category>/*hars*/network-logs-prompt-<ID>.har
+    if har_index is None:
+        har_index = build_har_index(datasets_root)
+    hits = har_index.get((category, prompt_id))
+    if hits:
+        return [hits[0].resolve()]
 
     # Fallbacks (rare): look inside the results folder or its parent category folder
     local = rdir / f"network-logs-prompt-{prompt_id}.har"
@@ -88,9 +126,10 @@ def aggregate_results(har_paths: List[Path], version: str) -> Dict[str, Any]:
         # target_url="https://chatgpt.com/backend-api/f/conversation",
     )
 
-    all_search_strings: List[str] = []
-    all_accessed: List[str] = []
-    all_cites: List[str] = []
+    # Insertion-ordered dicts as ordered sets: O(1) dedupe, first-seen order kept
+    all_search_strings: Dict[str, None] = {}
+    all_accessed: Dict[str, None] = {}
+    all_cites: Dict[str, None] = {}
     total_accessed = 0
     total_cites = 0
 
@@ -105,28 +144,25 @@ def aggregate_results(har_paths: List[Path], version: str) -> Dict[str, Any]:
         accessed = r.get("url", []) or []       # previously normal/accessed
         cites = r.get("cited_url", []) or []    # previously given/cited
 
-        total_accessed += int(r.get("n_accessed", 0) or 0)
-        total_cites += int(r.get("n_given", 0) or 0)
+        # Merge into the global ordered sets in the same pass
+        all_search_strings.update(dict.fromkeys(sstrings))
+        all_accessed.update(dict.fromkeys(accessed))
+        all_cites.update(dict.fromkeys(cites))
+
+        n_accessed = r.get("n_accessed")
+        n_given = r.get("n_given")
+        total_accessed += int(n_accessed or 0)
+        total_cites += int(n_given or 0)
 
         per_har.append({
             "harname": r.get("harname"),
             "search_strings": sstrings,
             "accessed": accessed,
             "cites": cites,
-            "n_accessed": r.get("n_accessed"),
-            "n_cites": r.get("n_given"),
+            "n_accessed": n_accessed,
+            "n_cites": n_given,
         })
 
-        for q in sstrings:
-            if q not in all_search_strings:
-                all_search_strings.append(q)
-        for u in accessed:
-            if u not in all_accessed:
-                all_accessed.append(u)
-        for u in cites:
-            if u not in all_cites:
-                all_cites.append(u)
-
     return {
         "version": version,
         "total_hars": len(har_paths),
@@ -137,13 +173,56 @@ def aggregate_results(har_paths: List[Path], version: str) -> Dict[str, Any]:
             "accessed_count": total_accessed,
             "cites_count": total_cites,
         },
-        "search_strings": all_search_strings,
-        "accessed": all_accessed,
-        "cites": all_cites,
+        "search_strings": list(all_search_strings),
+        "accessed": list(all_accessed),
+        "cites": list(all_cites),
         "hars": per_har,
     }
 
 
+def find_results_dirs(results_root: Path) -> List[Path]:
+    """
+    Collect every network-logs-prompt-* folder under results_root.
+    Iterative os.scandir walk: only directories are descended into, matched
+    folders are treated as leaves, and the cheap prefix check runs before
+    the regex.
+    """
+    result_dirs: List[Path] = []
+    stack = [str(results_root)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                # (prefix compared case-insensitively, like the re.I pattern)
+                if entry.name[:20].lower() == "network-logs-prompt-" and RESULTS_DIR_PATTERN.match(entry.name):
+                    result_dirs.append(Path(entry.path))
+                else:
+                    stack.append(entry.path)
+    return result_dirs
+
+
+def _process_one(task):
+    """
+    Worker for main()'s process pool: parse one results folder's HAR(s).
+    Whatever the parser prints is captured and handed back, so the parent
+    can print each folder's output in order instead of interleaved.
+    Returns (payload, out_path, captured_stdout).
+    """
+    rdir, prompt_id, category, version, har_paths, write_filename = task
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        summary = aggregate_results(har_paths, version)
+    payload = {
+        "prompt_id": int(prompt_id),
+        "category": category,
+        "results_folder": str(rdir),
+        **summary
+    }
+    return payload, rdir / write_filename, buf.getvalue()
+
+
+@lru_cache(maxsize=None)
 def detect_version_for_category(category: str) -> str:
     """By default, use GPT-5 if the category name contains 'gpt-5'."""
     return "gpt5" if ("gpt-5" in category.lower() or "gpt5" in category.lower()) else "gpt-o4"
@@ -170,10 +249,7 @@ def main():
         raise SystemExit(f"datasets_root does not exist: {datasets_root}")
 
     # Find all network-logs-prompt-* folders (any timestamp variant)
-    result_dirs: List[Path] = []
-    for p in results_root.rglob("*"):
-        if p.is_dir() and RESULTS_DIR_PATTERN.match(p.name):
-            result_dirs.append(p)
+    result_dirs = find_results_dirs(results_root)
 
     if not result_dirs:
         print(f"No results folders matching 'network-logs-prompt-*' under {results_root}")
@@ -181,40 +257,57 @@ def main():
 
     print(f"Found {len(result_dirs)} results folders.")
 
+    # One pass over the datasets tree instead of a directory scan per folder
+    har_index = build_har_index(datasets_root)
+
+    # Resolve every folder's HAR(s) up front, then parse them across processes
+    tasks = []
+    # Sibling folders share a category, so derive it once per parent dir
+    parent_to_category: Dict[Path, str] = {}
     for rdir in sorted(result_dirs):
         m = RESULTS_DIR_PATTERN.match(rdir.name)
         assert m
         prompt_id = m.group("prompt_id")
 
         # Derive category for version and datasets path
-        try:
-            rel = rdir.relative_to(results_root)
-            category = rel.parts[0] if rel.parts else rdir.parent.name
-        except Exception:
-            category = rdir.parent.name
+        category = parent_to_category.get(rdir.parent)
+        if category is None:
+            try:
+                rel = rdir.relative_to(results_root)
+                category = rel.parts[0] if rel.parts else rdir.parent.name
+            except Exception:
+                category = rdir.parent.name
+            # (folders directly under results_root are their own category)
+            if rdir.parent != results_root:
+                parent_to_category[rdir.parent] = category
 
         # Version selection
         version = detect_version_for_category(category) if args.version == "auto" else args.version
 
         # Determine the single HAR for this results dir
-        har_paths = find_har_for_results_dir(rdir, results_root, datasets_root, prompt_id)
-
-        summary = aggregate_results(har_paths, version)
-        out_path = rdir / args.write_filename
-        payload = {
-            "prompt_id": int(prompt_id),
-            "category": category,
-            "results_folder": str(rdir),
-            **summary
-        }
-
-        if args.dry_run:
-            print(f"\n[{rdir}] Would write {args.write_filename} with {len(summary.get('hars', []))} HAR(s).")
-            print(json.dumps(payload, indent=2)[:1000] + ("...\n" if len(json.dumps(payload)) > 1000 else "\n"))
-        else:
-            with open(out_path, "w", encoding="utf-8") as f:
-                json.dump(payload, f, indent=2)
-            print(f"Wrote {out_path}  (HARs: {len(summary.get('hars', []))}, ver: {version})")
+        har_paths = find_har_for_results_dir(rdir, results_root, datasets_root, prompt_id, har_index)
+
+        tasks.append((rdir, prompt_id, category, version, har_paths, args.write_filename))
+
+    # HAR parsing is CPU-bound, so spread folders over processes; map() keeps folder order
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for task, (payload, out_path, log) in zip(tasks, ex.map(_process_one, tasks)):
+            rdir, version = task[0], task[3]
+            print(log, end="")
+            n_hars = len(payload.get('hars', []))
+
+            if args.dry_run:
+                print(f"\n[{rdir}] Would write {args.write_filename} with {n_hars} HAR(s).")
+                blob = json.dumps(payload, indent=2)
+                print(blob[:1000] + ("...\n" if len(blob) > 1000 else "\n"))
+            else:
+                # Write a temp file in one go, then rename over the target so a
+                # crash never leaves a half-written query_meta.json behind
+                tmp_path = out_path.with_suffix(out_path.suffix + ".tmp")
+                with open(tmp_path, "wb", buffering=1 << 17) as f:
+                    f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+                os.replace(tmp_path, out_path)
+                print(f"Wrote {out_path}  (HARs: {n_hars}, ver: {version})")
 
 
 if __name__ == "__main__":